@@ -10,8 +10,9 @@
 #     ICS_WINDOW_START=YYYY-MM-DD     -> window start (when OPEN is false)
 #     ICS_WINDOW_END=YYYY-MM-DD       -> window end   (when OPEN is false)
 
-import os, re, unicodedata, sys
-from datetime import datetime, timedelta, date
+import bisect, os, re, time, unicodedata, sys
+from datetime import timedelta, date
+from functools import lru_cache
 from typing import List, Dict
 
 try:
@@ -20,6 +21,9 @@ except Exception as ex:
     print(f"::error::PyYAML not installed: {ex}")
     sys.exit(1)
 
+# libyaml-backed loader when available (much faster); pure-Python fallback
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 # --- Paths / constants ---
 REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 IN_YAML   = os.path.join(REPO_ROOT, "data", "events.yaml")
@@ -27,27 +31,61 @@ OUT_ICS   = os.path.join(REPO_ROOT, "whatson-shropshire-cheshire-northwales.ics"
 
 CAL_NAME = "What’s On — Shropshire • Cheshire • North Wales"
 PRODID   = "-//WhatsOn Builder//EN"
-DTSTAMP  = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+DTSTAMP  = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())  # avoids deprecated utcnow()
 EOL      = "\r\n"  # Apple-friendly line endings
 
 # --- Helpers ---
+_NON_ALNUM_RE = re.compile(r"[^a-zA-Z0-9]+")
+
+# ASCII-fold table for the accented ranges UK event titles actually contain
+# (Latin-1 Supplement + Latin Extended-A), precomputed once via NFKD so the
+# common case is a single translate pass instead of normalize+encode+decode.
+_UNI_TABLE = {
+    cp: unicodedata.normalize("NFKD", chr(cp)).encode("ascii","ignore").decode("ascii")
+    for cp in range(0x00A0, 0x0180)
+}
+
+@lru_cache(maxsize=4096)
 def slugify(text: str) -> str:
-    t = unicodedata.normalize("NFKD", text).encode("ascii","ignore").decode("ascii")
-    t = re.sub(r"[^a-zA-Z0-9]+","-",t).strip("-").lower()
-    return re.sub(r"-{2,}","-",t) or "event"
+    t = text.translate(_UNI_TABLE)
+    if not t.isascii():
+        # rare chars outside the table (•, em dashes, ...) take the slow path
+        t = unicodedata.normalize("NFKD", t).encode("ascii","ignore").decode("ascii")
+    # each non-alnum run becomes exactly one "-", so no dash-collapse pass needed
+    t = _NON_ALNUM_RE.sub("-", t).strip("-").lower()
+    return t or "event"
+
+_ESC_TABLE = str.maketrans({"\\": "\\\\", ",": "\\,", ";": "\\;", "\n": "\\n"})
+
+@lru_cache(maxsize=1024)
+def _esc_str(s: str) -> str:
+    return s.translate(_ESC_TABLE)
 
 def esc(s: str) -> str:
-    # RFC5545 text escaping
-    return str(s).replace("\\","\\\\").replace(",","\\,").replace(";","\\;").replace("\n","\\n")
+    # RFC5545 text escaping (single translate pass instead of chained replaces);
+    # cached because venue/category strings repeat across many events
+    return _esc_str(str(s))
+
+_YMD_RE = re.compile(r"^\d{4}-(?:0[1-9]|1[0-2])-(?:0[1-9]|[12]\d|3[01])$")
+
+def _valid_ymd(s) -> bool:
+    return isinstance(s, str) and _YMD_RE.match(s) is not None
 
 def parse_ymd(s: str) -> date:
-    return datetime.strptime(s, "%Y-%m-%d").date()
+    # fixed YYYY-MM-DD layout; slicing beats strptime's format interpreter
+    # (still raises ValueError on malformed input, like strptime did)
+    return date(int(s[0:4]), int(s[5:7]), int(s[8:10]))
+
+def _ymd(d: date) -> str:
+    # f-string formatting beats strftime's format parser for a fixed layout
+    return f"{d.year:04d}{d.month:02d}{d.day:02d}"
 
 # --- Tiny stanza: configurable date window via env ---
 DEFAULT_WINDOW_START = date(2025, 6, 1)
 DEFAULT_WINDOW_END   = date(2027, 12, 31)
 
-WINDOW_OPEN = (os.getenv("ICS_WINDOW_OPEN","").lower() in ("1","true","yes","on"))
+_TRUTHY = frozenset({"1","true","yes","on"})
+WINDOW_OPEN = os.getenv("ICS_WINDOW_OPEN","").lower() in _TRUTHY
 WS = os.getenv("ICS_WINDOW_START")
 WE = os.getenv("ICS_WINDOW_END")
 
@@ -60,14 +98,29 @@ def in_window(s: date, e: date) -> bool:
         return True
     return not (e < WINDOW_START or s > WINDOW_END)
 
+# --- Calendar envelope (constant per run; built + encoded once) ---
+_HEADER = (EOL.join([
+    "BEGIN:VCALENDAR",
+    "VERSION:2.0",
+    f"PRODID:{PRODID}",
+    "CALSCALE:GREGORIAN",
+    "METHOD:PUBLISH",
+    "X-WR-TIMEZONE:Europe/London",
+    f"X-WR-CALNAME:{esc(CAL_NAME)}",
+    "REFRESH-INTERVAL;VALUE=DURATION:P1D",
+    "X-PUBLISHED-TTL:PT12H",
+]) + EOL).encode("utf-8")
+_FOOTER = ("END:VCALENDAR" + EOL).encode("utf-8")
+
 # --- I/O ---
 def load_events(path: str) -> List[Dict]:
     if not os.path.exists(path):
         print(f"[warn] missing file: {path} (0 events)")
         return []
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            y = yaml.safe_load(f) or {}
+        # binary mode: libyaml decodes UTF-8 itself, skipping TextIOWrapper
+        with open(path, "rb") as f:
+            y = yaml.load(f, Loader=YAML_LOADER) or {}
         evs = y.get("events", [])
         if not isinstance(evs, list):
             print("[warn] 'events' key is not a list; ignoring.")
@@ -78,108 +131,131 @@ def load_events(path: str) -> List[Dict]:
         return []
 
 # --- VEVENT builder ---
-def build_vevent(e: Dict) -> str:
+def build_vevent(e: Dict, s: date, e_date: date) -> str:
+    """Render one event; dates are pre-parsed by the caller (parsed once in main)."""
     try:
-        summary   = e["summary"]
-        start_str = e["start"]
+        summary = e["summary"]
     except KeyError as ex:
         print(f"[warn] missing required field {ex} -> skipping: {e}")
         return ""
 
-    end_str   = e.get("end", start_str)
     location  = e.get("location","")
     url       = (e.get("url","") or "").strip()
     cats      = (e.get("categories","") or "").strip().strip(",")
     desc      = e.get("description","") or ""
 
-    try:
-        s = parse_ymd(start_str)
-        e_date = parse_ymd(end_str)
-    except Exception as ex:
-        print(f"[warn] bad date(s) in '{summary}': {ex}; skipping")
-        return ""
     if e_date < s:
         e_date = s
-    if not in_window(s, e_date):
-        return ""  # outside window
 
-    dtend = (e_date + timedelta(days=1)).strftime("%Y%m%d")
+    dtend = _ymd(e_date + timedelta(days=1))
     uid = f"{slugify(summary)}-{s.year}@whatson.local"
 
-    lines = []
-    lines.append("BEGIN:VEVENT")
-    lines.append(f"UID:{uid}")
-    lines.append(f"DTSTAMP:{DTSTAMP}")
-    lines.append(f"DTSTART;VALUE=DATE:{s.strftime('%Y%m%d')}")
-    lines.append(f"DTEND;VALUE=DATE:{dtend}")
-    lines.append(f"SUMMARY:{esc(summary)}")
-    if location:
-        lines.append(f"LOCATION:{esc(location)}")
-
     # DESCRIPTION (only if there is text or URL)
     desc_parts = []
     if desc:
         desc_parts.append(esc(desc))
     if url:
         desc_parts.append("More: " + url)
-    if desc_parts:
-        lines.append("DESCRIPTION:" + "\\n".join(desc_parts))
 
-    if url:
-        lines.append(f"URL:{url}")
-    if cats:
-        lines.append(f"CATEGORIES:{esc(cats)}")
+    # Fast path: fully-populated events (the scraper's usual shape) render as
+    # one straight-line f-string with no per-field branching.
+    if location and desc_parts and url and cats:
+        description = "\\n".join(desc_parts)
+        return (
+            f"BEGIN:VEVENT{EOL}"
+            f"UID:{uid}{EOL}"
+            f"DTSTAMP:{DTSTAMP}{EOL}"
+            f"DTSTART;VALUE=DATE:{_ymd(s)}{EOL}"
+            f"DTEND;VALUE=DATE:{dtend}{EOL}"
+            f"SUMMARY:{esc(summary)}{EOL}"
+            f"LOCATION:{esc(location)}{EOL}"
+            f"DESCRIPTION:{description}{EOL}"
+            f"URL:{url}{EOL}"
+            f"CATEGORIES:{esc(cats)}{EOL}"
+            f"STATUS:CONFIRMED{EOL}"
+            f"TRANSP:TRANSPARENT{EOL}"
+            "END:VEVENT"
+        )
+
+    return (
+        f"BEGIN:VEVENT{EOL}"
+        f"UID:{uid}{EOL}"
+        f"DTSTAMP:{DTSTAMP}{EOL}"
+        f"DTSTART;VALUE=DATE:{_ymd(s)}{EOL}"
+        f"DTEND;VALUE=DATE:{dtend}{EOL}"
+        f"SUMMARY:{esc(summary)}{EOL}"
+        + (f"LOCATION:{esc(location)}{EOL}" if location else "")
+        + ("DESCRIPTION:" + "\\n".join(desc_parts) + EOL if desc_parts else "")
+        + (f"URL:{url}{EOL}" if url else "")
+        + (f"CATEGORIES:{esc(cats)}{EOL}" if cats else "")
+        + f"STATUS:CONFIRMED{EOL}"
+        f"TRANSP:TRANSPARENT{EOL}"
+        "END:VEVENT"
+    )
 
-    lines.append("STATUS:CONFIRMED")
-    lines.append("TRANSP:TRANSPARENT")
-    lines.append("END:VEVENT")
-    return EOL.join(lines)
+def build_vevent_from_dict(e: Dict) -> str:
+    """Old-style entry point: parse the dates here, then render."""
+    try:
+        s = parse_ymd(e["start"])
+        e_date = parse_ymd(e.get("end", e["start"]))
+    except Exception as ex:
+        print(f"[warn] bad date(s) in '{e.get('summary','')}': {ex}; skipping")
+        return ""
+    if not in_window(s, e_date if e_date >= s else s):
+        return ""  # outside window
+    return build_vevent(e, s, e_date)
 
 # --- Main ---
 def main() -> int:
     evs = load_events(IN_YAML)
 
+    # Single pass: dedup and parse together, then one sort.
     cleaned = []
-    for e in evs:
-        try:
-            s = parse_ymd(e["start"])
-            e_end = parse_ymd(e.get("end", e["start"]))
-            cleaned.append((s, e_end, e))
-        except Exception as ex:
-            print(f"[warn] skipping event due to date parse: {ex} -> {e}")
-    cleaned.sort(key=lambda t: t[0])
-
-    vevents = []
     seen = set()
-    for s, e_end, e in cleaned:
-        ve = build_vevent(e)
-        if not ve:
-            continue
-        key = (e.get("summary",""), s.isoformat())
+    for e in evs:
+        # Dedup on the raw strings first so duplicates skip date parsing too.
+        key = (e.get("summary",""), e.get("start",""))
         if key in seen:
             continue
         seen.add(key)
-        vevents.append(ve)
-
-    header = [
-        "BEGIN:VCALENDAR",
-        "VERSION:2.0",
-        f"PRODID:{PRODID}",
-        "CALSCALE:GREGORIAN",
-        "METHOD:PUBLISH",
-        "X-WR-TIMEZONE:Europe/London",
-        f"X-WR-CALNAME:{esc(CAL_NAME)}",
-        "REFRESH-INTERVAL;VALUE=DURATION:P1D",
-        "X-PUBLISHED-TTL:PT12H",
-    ]
-    footer = ["END:VCALENDAR"]
-
-    vcal = EOL.join(header + vevents + footer) + EOL  # final EOL
-
-    with open(OUT_ICS, "w", encoding="utf-8", newline="") as f:
-        f.write(vcal)
-
-    print(f"Wrote {OUT_ICS} with {len(vevents)} events.")
+        start_str = e.get("start")
+        end_str   = e.get("end", start_str)
+        # Cheap regex check instead of try/except: no exception machinery on
+        # the happy path, and bad rows skip without raising at all.
+        if not (_valid_ymd(start_str) and _valid_ymd(end_str)):
+            print(f"[warn] skipping event due to bad date(s): {e}")
+            continue
+        try:
+            # backstop: the regex can't catch e.g. Feb 30 / Apr 31
+            cleaned.append((parse_ymd(start_str), parse_ymd(end_str), e))
+        except ValueError as ex:
+            print(f"[warn] skipping event due to bad date(s): {ex} -> {e}")
+    cleaned.sort(key=lambda t: t[0])
+
+    # Window filter on the sorted list: bisect away the tail (start past the
+    # window) in O(log n); the head needs a pointwise end-date check because
+    # an event can start before the window but run into it.
+    if not WINDOW_OPEN:
+        starts = [t[0] for t in cleaned]
+        hi = bisect.bisect_right(starts, WINDOW_END)
+        del cleaned[hi:]
+        cleaned = [t for t in cleaned
+                   if (t[1] if t[1] >= t[0] else t[0]) >= WINDOW_START]
+
+    # Stream each VEVENT straight to disk instead of materializing the whole
+    # calendar string (keeps peak memory at one event, not the full feed).
+    # Binary handle: encode each chunk once ourselves and skip TextIOWrapper.
+    n = 0
+    with open(OUT_ICS, "wb") as f:
+        f.write(_HEADER)
+        for s, e_end, e in cleaned:
+            ve = build_vevent(e, s, e_end)
+            if ve:
+                f.write((ve + EOL).encode("utf-8"))
+                n += 1
+        f.write(_FOOTER)
+
+    print(f"Wrote {OUT_ICS} with {n} events.")
     return 0
 
 if __name__ == "__main__":
@@ -7,19 +7,27 @@
 # Usage:
 #  python scripts/scrape_shropshire_events_guide.py --from 2025-06-01 --to 2026-12-31 --out data/events.yaml --merge
 
-import argparse, os, re, sys, time
-from datetime import date, datetime
-from urllib.parse import urlparse, parse_qs, urljoin
+import argparse, asyncio, bisect, json, os, re, sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from datetime import date, datetime, timedelta
+from urllib.parse import urljoin
 
+import httpx
 import yaml
 import requests
-from bs4 import BeautifulSoup
+from requests_cache import CachedSession
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup, SoupStrainer
 
 BASE = "https://shropshire-events-guide.co.uk"
 START_PAGE = f"{BASE}/"
 UA = "Mozilla/5.0 (GitHub Actions; +https://github.com/) WhatsOn-Scraper/1.1"
 TIMEOUT = 25
-SLEEP = 0.6
+CONCURRENCY = 8  # parallel fetches; also caps request rate against the site
+CACHE_DIR = os.path.join(".cache", "shropshire")
+STATE_PATH = os.path.join(".cache", "state.json")
 
 MONTHS = {m.lower(): i for i, m in enumerate(
     ["January","February","March","April","May","June","July","August","September","October","November","December"], 1)}
@@ -27,15 +35,17 @@ MONTHS = {m.lower(): i for i, m in enumerate(
 DATE_RE = re.compile(
     r"(\d{1,2})(?:st|nd|rd|th)?\s+"
     r"(January|February|March|April|May|June|July|August|September|October|November|December)"
-    r"\s+(\d{4})", re.I
+    r"\s+(\d{4})", re.I | re.ASCII
 )
 
 def iso(d: date) -> str: return d.strftime("%Y-%m-%d")
+def date_from_match(m: re.Match) -> date:
+    day, mon, yr = m.groups()
+    return date(int(yr), MONTHS[mon.lower()], int(day))
 def parse_date_token(tok: str) -> date:
     m = DATE_RE.search(tok)
     if not m: raise ValueError(f"no date in: {tok[:120]}")
-    day, mon, yr = m.groups()
-    return date(int(yr), MONTHS[mon.lower()], int(day))
+    return date_from_match(m)
 
 def add_months(d: date, n: int) -> date:
     y = d.year + (d.month - 1 + n) // 12
@@ -43,17 +53,80 @@ def add_months(d: date, n: int) -> date:
     return date(y, m, 1)
 
 def get_session() -> requests.Session:
-    s = requests.Session()
-    s.headers.update({"User-Agent": UA, "Accept": "text/html,application/json"})
+    # Transparent sqlite-backed HTTP cache for the sync one-shot GETs
+    # (homepage cid discovery, JSON API probe); honors ETag/Cache-Control.
+    # HEAD stays uncached so the change probe always hits the wire.
+    s = CachedSession(os.path.join(".cache", "http"), backend="sqlite",
+                      expire_after=timedelta(days=7), cache_control=True,
+                      allowable_methods=["GET"])
+    # Single host: one pooled keep-alive connection avoids a TLS handshake per
+    # request, and retries ride out transient 5xx/429 from the shared WP host.
+    adapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=16,
+        max_retries=Retry(total=3, backoff_factor=0.5,
+                          status_forcelist=[429, 500, 502, 503, 504],
+                          allowed_methods=["GET"]))
+    s.mount("https://", adapter)
+    s.headers.update({
+        "User-Agent": UA,
+        "Accept": "text/html,application/json",
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive",
+    })
     return s
 
+# ---------- change probe: skip the whole crawl when the site is unchanged ----------
+def _load_state() -> dict:
+    try:
+        return json.load(open(STATE_PATH, encoding="utf-8"))
+    except Exception:
+        return {}
+
+def _save_state(state: dict):
+    os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
+    with open(STATE_PATH, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+
+def homepage_unchanged(sess: requests.Session) -> tuple[bool, dict]:
+    """HEAD the calendar root with the validators saved by the last successful
+    run; returns (True, state) on 304 so main can bail out after one RTT.
+    The fresh validators ride back in `state` for saving post-scrape."""
+    state = _load_state()
+    hdrs = {}
+    if state.get("etag"):          hdrs["If-None-Match"] = state["etag"]
+    if state.get("last_modified"): hdrs["If-Modified-Since"] = state["last_modified"]
+    try:
+        r = sess.head(START_PAGE, headers=hdrs, timeout=TIMEOUT, allow_redirects=True)
+        if hdrs and r.status_code == 304:
+            return True, state
+        fresh = {"etag": r.headers.get("ETag"),
+                 "last_modified": r.headers.get("Last-Modified")}
+        if "mc_api" in state:
+            fresh["mc_api"] = state["mc_api"]
+        state = fresh
+    except Exception as ex:
+        print(f"[head] probe failed: {ex}")
+    return False, state
+
 # ---------- 1) My Calendar JSON API (often disabled) ----------
-def try_mc_api(sess: requests.Session, dfrom: date, dto: date):
+def try_mc_api(sess: requests.Session, dfrom: date, dto: date) -> tuple[bool | None, list]:
+    """Returns (api_enabled, events). enabled=False only on a definitive
+    answer (404 / 200-with-HTML) so future runs can skip the round-trip;
+    None means the probe was inconclusive (timeout, 5xx, ...) and the next
+    run should ask again."""
     url = f"{BASE}/?my-calendar-api=events&format=json&from={iso(dfrom)}&to={iso(dto)}"
     try:
         r = sess.get(url, timeout=TIMEOUT)
+        if r.status_code == 404:
+            print("[mc-api] HTTP 404"); return False, []
         if r.status_code != 200:
-            print(f"[mc-api] HTTP {r.status_code}"); return []
+            print(f"[mc-api] HTTP {r.status_code}"); return None, []
+        ctype = r.headers.get("Content-Type", "")
+        if "json" not in ctype:
+            # disabled installs answer 200 with the normal HTML page; don't
+            # pay for a doomed .json() parse + exception
+            print(f"[mc-api] not JSON ({ctype.split(';')[0] or 'unknown'})")
+            return False, []
         data = r.json()
         raw = data if isinstance(data, list) else data.get("events", [])
         out = []
@@ -73,25 +146,29 @@ def try_mc_api(sess: requests.Session, dfrom: date, dto: date):
             except Exception:
                 continue
         print(f"[mc-api] events: {len(out)}")
-        return out
+        return True, out
     except Exception as ex:
         print(f"[mc-api] unavailable: {ex}")
-        return []
+        return None, []
 
 # ---------- 2) HTML monthly page parsing ----------
+# cid extraction needs no tree semantics; a narrow regex over the raw HTML
+# beats building a full parse tree just to read one link
+_PREV_CID_RE = re.compile(
+    r'<a\b[^>]*[?&](?:amp;)?cid=([^&"\']+)[^>]*>'
+    r'\s*(?:<[^>]*>\s*)*(?:«|&laquo;)?\s*Previous\b', re.I)
+
 def discover_cid(sess: requests.Session) -> str | None:
-    # Find the calendar id by inspecting the "Previous" link on the homepage
+    # Find the calendar id by inspecting the "Previous" link on the homepage;
+    # no match means no cid, and month_url falls back to cid-less URLs
     try:
         r = sess.get(START_PAGE, timeout=TIMEOUT)
         r.raise_for_status()
-        soup = BeautifulSoup(r.text, "lxml")
-        prev = soup.find("a", string=lambda t: t and t.strip().lower()=="previous")
-        if prev and prev.has_attr("href"):
-            q = parse_qs(urlparse(prev["href"]).query)
-            cid = q.get("cid", [None])[0]
-            if cid:
-                print(f"[html] discovered cid={cid}")
-                return cid
+        m = _PREV_CID_RE.search(r.text)
+        if m:
+            cid = m.group(1)
+            print(f"[html] discovered cid={cid}")
+            return cid
     except Exception as ex:
         print(f"[html] cid discovery failed: {ex}")
     return None
@@ -101,9 +178,18 @@ def month_url(cid: str | None, y: int, m: int) -> str:
         return f"{START_PAGE}?cid={cid}&month={m}&yr={y}"
     return f"{START_PAGE}?month={m}&yr={y}"
 
-def parse_month_inline_events(html: str, dfrom: date, dto: date) -> list[dict]:
+# Heuristic tokens, compiled/frozen once instead of per anchor/segment
+_SKIP_ANCHOR_TOKENS = ("view location", "map ", "more information")
+_LOC_RE = re.compile(r"Shrewsbury|Ludlow|Oswestry|Telford|SY")
+_WS_RE = re.compile(r"\s+")
+
+# Only the tags the event blocks are made of; skips <head>, scripts, styles
+# and other chrome at parse time (outermost matching <div> keeps its subtree).
+_MONTH_STRAINER = SoupStrainer(["h2", "h3", "p", "div", "a"])
+
+def parse_month_inline_events(html: bytes | str, dfrom: date, dto: date) -> list[dict]:
     """Parse headings/blocks on the month page itself."""
-    soup = BeautifulSoup(html, "lxml")
+    soup = BeautifulSoup(html, "lxml", parse_only=_MONTH_STRAINER)
     events: list[dict] = []
 
     # Each event appears as an <h3> anchor followed by an <h2> title and a small block with times/location.
@@ -115,6 +201,20 @@ def parse_month_inline_events(html: str, dfrom: date, dto: date) -> list[dict]:
                 break
             block_nodes.append(sib)
 
+        # Cheap date probe before paying for the full block soup: calendar
+        # chrome h3s ("Upcoming Events" etc) have no date anywhere near them.
+        # NavigableStrings answer get_text too, so this covers bare text nodes.
+        probe_parts = [h3.get_text(" ", strip=True)]
+        probe_len = 0
+        for n in block_nodes:
+            t = n.get_text(" ", strip=True) if hasattr(n, "get_text") else str(n)
+            probe_parts.append(t)
+            probe_len += len(t)
+            if probe_len >= 500:  # a real event states its date up front
+                break
+        if not DATE_RE.search(" ".join(probe_parts)):
+            continue
+
         # Title is usually an <h2> right after <h3>
         title = None
         for node in block_nodes:
@@ -125,18 +225,30 @@ def parse_month_inline_events(html: str, dfrom: date, dto: date) -> list[dict]:
             # fallback: text of the h3 itself (it contains time/venue too)
             title = h3.get_text(" ", strip=True)
 
-        # Flatten text of the block to find dates/times
-        flat = " ".join(BeautifulSoup("".join(str(n) for n in block_nodes), "lxml").get_text(" ", strip=True).split())
+        # Parse the sibling block once; every sub-extraction below reuses it
+        # instead of re-serializing + re-parsing the same nodes.
+        block_soup = BeautifulSoup("".join(str(n) for n in block_nodes), "lxml")
 
-        # Extract dates (may be a range with an en dash)
-        m1 = DATE_RE.search(flat) or DATE_RE.search(h3.get_text(" ", strip=True))
-        if not m1:
+        # Flatten text of the block to find dates/times (one C-level regex
+        # pass instead of split-into-list + join)
+        flat = _WS_RE.sub(" ", block_soup.get_text(" ", strip=True))
+
+        # Extract dates (may be a range with an en dash): one finditer pass
+        # over the block text instead of search + search-on-tail
+        matches = list(islice(DATE_RE.finditer(flat), 2))
+        if not matches:
+            m = DATE_RE.search(h3.get_text(" ", strip=True))
+            if not m:
+                continue
+            matches = [m]
+        try:
+            start = date_from_match(matches[0])
+            end = date_from_match(matches[1]) if len(matches) > 1 else start
+        except ValueError as ex:
+            # e.g. "31st February 2025" in the page text; skip the block,
+            # don't kill the crawl (mirrors the build-side date backstop)
+            print(f"[html] skipping block with bad date: {ex}")
             continue
-        start = parse_date_token(m1.group(0))
-        # look for second date in the remaining text
-        tail = flat[m1.end():]
-        m2 = DATE_RE.search(tail)
-        end = parse_date_token(m2.group(0)) if m2 else start
         if end < start:
             end = start
 
@@ -144,15 +256,17 @@ def parse_month_inline_events(html: str, dfrom: date, dto: date) -> list[dict]:
         if start > dto or end < dfrom:
             continue
 
+        block_anchors = block_soup.find_all("a", href=True)
+
         # Location heuristics
         location = ""
         # 1) a venue anchor often exists in the block (exclude "View Location"/"Map"/"More Information")
-        for a in BeautifulSoup("".join(str(n) for n in block_nodes), "lxml").find_all("a", href=True):
+        for a in block_anchors:
             txt = (a.get_text(" ", strip=True) or "").strip()
             if not txt:
                 continue
             low = txt.lower()
-            if any(key in low for key in ("view location", "map ", "more information")):
+            if any(key in low for key in _SKIP_ANCHOR_TOKENS):
                 continue
             if len(txt) <= 60:
                 location = txt
@@ -161,13 +275,13 @@ def parse_month_inline_events(html: str, dfrom: date, dto: date) -> list[dict]:
         if not location:
             segs = flat.split("  ")
             for seg in segs:
-                if any(t in seg for t in ("Shrewsbury", "Ludlow", "Oswestry", "Telford", "SY")):
+                if _LOC_RE.search(seg):
                     location = seg.strip()
                     break
 
         # “More Information” URL if present
         url = ""
-        for a in BeautifulSoup("".join(str(n) for n in block_nodes), "lxml").find_all("a", href=True):
+        for a in block_anchors:
             if (a.get_text(" ", strip=True) or "").strip().lower() == "more information":
                 href = a["href"]
                 url = href if href.startswith("http") else urljoin(BASE, href)
@@ -175,7 +289,8 @@ def parse_month_inline_events(html: str, dfrom: date, dto: date) -> list[dict]:
 
         # Short description: first paragraph-like text with length > 40
         desc = ""
-        for p in BeautifulSoup("".join(str(n) for n in block_nodes), "lxml").find_all(["p", "div"]):
+        # cap the scan: a usable paragraph is always near the top of the block
+        for p in islice(block_soup.find_all(["p", "div"]), 10):
             txt = (p.get_text(" ", strip=True) or "").strip()
             if len(txt) > 40:
                 desc = txt[:600]
@@ -192,36 +307,119 @@ def parse_month_inline_events(html: str, dfrom: date, dto: date) -> list[dict]:
         ))
     return events
 
-def crawl_months(sess: requests.Session, dfrom: date, dto: date) -> list[dict]:
-    evs: list[dict] = []
+# --- month-page cache (conditional GET; unchanged months become local reads) ---
+def _cache_read(ym: str):
+    """Return (html, validator_headers) for a cached month, or (None, {})."""
+    html_path = os.path.join(CACHE_DIR, f"{ym}.html")
+    if not os.path.exists(html_path):
+        return None, {}
+    try:
+        html = open(html_path, "rb").read()
+    except Exception:
+        return None, {}
+    hdrs = {}
+    try:
+        meta = json.load(open(html_path + ".json", encoding="utf-8"))
+        if meta.get("etag"):          hdrs["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"): hdrs["If-Modified-Since"] = meta["last_modified"]
+    except Exception:
+        pass
+    return html, hdrs
+
+def _cache_write(ym: str, html: bytes, etag: str | None, last_modified: str | None):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    html_path = os.path.join(CACHE_DIR, f"{ym}.html")
+    with open(html_path, "wb") as f:
+        f.write(html)
+    with open(html_path + ".json", "w", encoding="utf-8") as f:
+        json.dump({"etag": etag, "last_modified": last_modified}, f)
+
+async def fetch_month_pages(month_urls: list[tuple[str, str]]) -> dict[str, bytes]:
+    """Fetch all (yyyy-mm, url) pairs concurrently (bounded by CONCURRENCY);
+    returns {yyyy-mm: html bytes}. Months unchanged since the last run (304)
+    come straight from the on-disk cache. Bodies stay as raw bytes — lxml
+    sniffs the charset itself, so no Python-side decode pass is needed."""
+    results: dict[str, bytes] = {}
+    sem = asyncio.Semaphore(CONCURRENCY)
+    # HTTP/2: every month page multiplexes over one TLS connection to the
+    # single host instead of opening a socket per in-flight request
+    limits = httpx.Limits(max_connections=4, max_keepalive_connections=4)
+    headers = {"User-Agent": UA, "Accept": "text/html,application/json"}
+    async with httpx.AsyncClient(http2=True, limits=limits, timeout=TIMEOUT,
+                                 headers=headers, follow_redirects=True) as client:
+        async def fetch(ym: str, u: str):
+            cached, validators = _cache_read(ym)
+            async with sem:
+                try:
+                    r = await client.get(u, headers=validators)
+                    if r.status_code == 304 and cached is not None:
+                        print(f"[html] {ym} -> 304 (cache)")
+                        results[ym] = cached
+                        return
+                    if r.status_code != 200:
+                        print(f"[html] {u} -> HTTP {r.status_code}")
+                        return
+                    html = r.content
+                    results[ym] = html
+                    _cache_write(ym, html,
+                                 r.headers.get("ETag"),
+                                 r.headers.get("Last-Modified"))
+                except Exception as ex:
+                    print(f"[html] error {u}: {ex}")
+        await asyncio.gather(*(fetch(ym, u) for ym, u in month_urls))
+    return results
+
+def crawl_months(sess: requests.Session, dfrom: date, dto: date) -> dict[tuple, dict]:
+    """Crawl the window's month pages; returns {(summary, start): event} with
+    the first (earliest-month) occurrence winning."""
+    evs: dict[tuple, dict] = {}
     cid = discover_cid(sess)
+
+    months: list[date] = []
     cur = date(dfrom.year, dfrom.month, 1)
     endm = date(dto.year, dto.month, 1)
-    seen = set()
     while cur <= endm:
-        u = month_url(cid, cur.year, cur.month)
-        try:
-            r = sess.get(u, timeout=TIMEOUT)
-            if r.status_code != 200:
-                print(f"[html] {cur.year}-{cur.month:02d} -> HTTP {r.status_code}")
-                cur = add_months(cur, 1); time.sleep(SLEEP); continue
-            batch = parse_month_inline_events(r.text, dfrom, dto)
-            for e in batch:
-                key = (e["summary"], e["start"])
-                if key in seen: continue
-                seen.add(key); evs.append(e)
-            print(f"[html] {cur.year}-{cur.month:02d} events: {len(batch)} (total {len(evs)})")
-        except Exception as ex:
-            print(f"[html] error {cur}: {ex}")
+        months.append(cur)
         cur = add_months(cur, 1)
-        time.sleep(SLEEP)
+
+    # Month fetches are pure I/O latency; fan them out instead of sleeping
+    # between sequential GETs (the semaphore keeps us polite to the site).
+    month_urls = [(f"{m.year}-{m.month:02d}", month_url(cid, m.year, m.month))
+                  for m in months]
+    pages = asyncio.run(fetch_month_pages(month_urls))
+
+    # Parsing is CPU-bound and GIL-serialized; fan the fetched pages out to a
+    # process pool and merge in month order here (single-writer).
+    fetched = [(ym, html) for ym, html in
+               ((f"{m.year}-{m.month:02d}", pages.get(f"{m.year}-{m.month:02d}"))
+                for m in months) if html is not None]
+    if len(fetched) > 2:
+        with ProcessPoolExecutor(max_workers=min(len(fetched), os.cpu_count() or 1)) as pool:
+            batches = dict(zip((ym for ym, _ in fetched),
+                               pool.map(parse_month_inline_events,
+                                        (html for _, html in fetched),
+                                        (dfrom for _ in fetched),
+                                        (dto for _ in fetched))))
+    else:  # not worth spawning workers for a page or two
+        batches = {ym: parse_month_inline_events(html, dfrom, dto)
+                   for ym, html in fetched}
+
+    for ym, _ in fetched:
+        batch = batches[ym]
+        for e in batch:
+            evs.setdefault((e["summary"], e["start"]), e)
+        print(f"[html] {ym} events: {len(batch)} (total {len(evs)})")
     return evs
 
 # ---------- YAML merge helpers ----------
+# libyaml C bindings when available (same idea as lxml vs html.parser)
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
 def load_yaml(path: str) -> list[dict]:
     if not os.path.exists(path): return []
     try:
-        y = yaml.safe_load(open(path, encoding="utf-8")) or {}
+        y = yaml.load(open(path, "rb"), Loader=YAML_LOADER) or {}
         lst = y.get("events", [])
         return lst if isinstance(lst, list) else []
     except Exception:
@@ -230,18 +428,25 @@ def load_yaml(path: str) -> list[dict]:
 def dump_yaml(path: str, events: list[dict]):
     os.makedirs(os.path.dirname(path), exist_ok=True)
     with open(path, "w", encoding="utf-8") as f:
-        yaml.safe_dump({"events": events}, f, allow_unicode=True, sort_keys=False)
+        yaml.dump({"events": events}, f, Dumper=YAML_DUMPER,
+                  allow_unicode=True, sort_keys=False)
+
+def _merge_key(e: dict):
+    return (e.get("start",""), e.get("summary","").lower())
 
 def merge_events(existing: list[dict], new: list[dict]) -> list[dict]:
     seen = {(e.get("summary","").strip(), e.get("start","").strip()) for e in existing}
-    out = list(existing)
+    # dump_yaml always writes sorted files, so this sort is a near-no-op pass;
+    # new rows then insort in place of re-sorting the whole list at the end
+    out = sorted(existing, key=_merge_key)
     added = 0
     for e in new:
         k = (e.get("summary","").strip(), e.get("start","").strip())
         if not k[0] or not k[1]: continue
         if k in seen: continue
-        seen.add(k); out.append(e); added += 1
-    out.sort(key=lambda x: (x.get("start",""), x.get("summary","").lower()))
+        seen.add(k)
+        bisect.insort(out, e, key=_merge_key)
+        added += 1
     print(f"[merge] added {added} new; total {len(out)}")
     return out
 
@@ -259,19 +464,28 @@ def main():
 
     sess = get_session()
 
-    all_events = []
-    # 1) JSON API (if the site allows it)
-    all_events += try_mc_api(sess, dfrom, dto)
+    unchanged, state = homepage_unchanged(sess)
+    if unchanged:
+        print("[head] calendar root unchanged since last run; nothing to do")
+        return
+
+    # Both sources land in one dict keyed by (summary, start) — the HTML crawl
+    # overrides the JSON API on collisions, with no separate dedup pass.
+    dedup: dict[tuple, dict] = {}
+    # 1) JSON API (if the site allows it; once known disabled, skip the RTT)
+    if state.get("mc_api") != "no":
+        enabled, api_events = try_mc_api(sess, dfrom, dto)
+        if enabled is not None:  # inconclusive probes don't update the flag
+            state["mc_api"] = "yes" if enabled else "no"
+        for e in api_events:
+            if not e: continue
+            dedup[(e["summary"], e["start"])] = e
+    else:
+        print("[mc-api] skipped (cached probe says disabled)")
     # 2) Monthly HTML (inline blocks)
-    all_events += crawl_months(sess, dfrom, dto)
-
-    # De-dup within this run
-    dedup = {}
-    for e in all_events:
-        if not e: continue
-        dedup[(e["summary"], e["start"])] = e
-    scraped = list(dedup.values())
-    scraped.sort(key=lambda x: (x["start"], x["summary"].lower()))
+    dedup.update(crawl_months(sess, dfrom, dto))
+
+    scraped = sorted(dedup.values(), key=lambda x: (x["start"], x["summary"].lower()))
     print(f"[total] scraped: {len(scraped)}")
 
     if args.merge:
@@ -281,6 +495,10 @@ def main():
     else:
         dump_yaml(args.out, scraped)
 
+    # Only remember the probe validators once the scrape landed, so a failed
+    # run doesn't make the next one skip.
+    _save_state(state)
+
 if __name__ == "__main__":
     sys.exit(main())
 